@@ -0,0 +1,20 @@
+# do_luong.py
+# Hàm đo đạc dùng chung cho các công cụ đo hiệu năng (evaluate_ocr.py, load_test.py).
+import resource
+import sys
+
+
+def rss_dinh_mb():
+    """RAM đỉnh (MB) của tiến trình hiện tại."""
+    # ru_maxrss: KB trên Linux, byte trên macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+def phan_vi(values, p):
+    """Phân vị thứ `p` (0-100) theo hạng gần nhất; 0.0 nếu danh sách rỗng."""
+    if not values:
+        return 0.0
+    values = sorted(values)
+    k = min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))
+    return values[k]
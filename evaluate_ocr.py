@@ -0,0 +1,267 @@
+# evaluate_ocr.py
+# So sánh các engine OCR trên bộ ảnh đã gán nhãn: độ trễ, bộ nhớ, độ chính xác theo trường.
+#
+# Cách dùng:
+#   python evaluate_ocr.py nhan.csv --engine easyocr paddleocr
+#
+# File nhãn là CSV (UTF-8) với cột: file,loai,ho_ten,so_cccd,que_quan,so_luong
+#   - file: đường dẫn ảnh (tương đối so với thư mục chứa file CSV)
+#   - loai: "cccd" hoặc "can"
+#   - các cột còn lại: giá trị đúng, để trống nếu không áp dụng cho loại ảnh
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import time
+
+from do_luong import phan_vi, rss_dinh_mb
+from ocr import TRUONG_THEO_LOAI, OCREngine, tao_engine, trich_xuat_cccd, trich_xuat_can
+
+
+def doc_nhan(duong_dan):
+    thu_muc = os.path.dirname(os.path.abspath(duong_dan))
+    mau = []
+    with open(duong_dan, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            loai = row["loai"].strip()
+            if loai not in TRUONG_THEO_LOAI:
+                raise ValueError(f"Loại ảnh không hợp lệ '{loai}' cho file {row['file']}")
+            mau.append({
+                "file": os.path.join(thu_muc, row["file"]),
+                "loai": loai,
+                "nhan": {k: (row.get(k) or "").strip() for k in TRUONG_THEO_LOAI[loai]},
+            })
+    return mau
+
+
+def _chuan_hoa(truong, gia_tri):
+    gia_tri = " ".join(str(gia_tri).split())
+    if truong == "so_luong":
+        try:
+            return round(float(gia_tri.replace(",", ".")), 6)
+        except ValueError:
+            return gia_tri
+    if truong == "so_cccd":
+        return gia_tri.replace(" ", "")
+    return gia_tri.upper()
+
+
+class _EngineDemLoi(OCREngine):
+    """Bọc engine để đếm lỗi và kết quả rỗng cho từng ảnh.
+
+    Các hàm trich_xuat_* nuốt mọi exception và trả về "", nên engine hỏng trông như
+    engine chạy rất nhanh; lớp bọc ghi nhận lỗi rồi ném lại để giữ nguyên luồng fallback.
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.vi_du_loi = None
+        self.bat_dau_anh()
+
+    def bat_dau_anh(self):
+        self.co_loi = False
+        self.co_chu = False
+
+    def readtext(self, img):
+        try:
+            texts = self.engine.readtext(img)
+        except Exception as e:
+            self.co_loi = True
+            self.vi_du_loi = self.vi_du_loi or f"{type(e).__name__}: {e}"
+            raise
+        if texts:
+            self.co_chu = True
+        return texts
+
+
+def _ket_qua_loi_tai(ten_engine, mau, loi):
+    """Kết quả cho engine không tải được: mọi ảnh tính là lỗi để không được đề xuất."""
+    return {
+        "engine": ten_engine,
+        "loi_tai": True,
+        "thoi_gian_tai_s": 0.0,
+        "bo_nho_model_mb": 0.0,
+        "bo_nho_dinh_mb": 0.0,
+        "vi_du_loi": f"{type(loi).__name__}: {loi}",
+        "theo_loai": {
+            loai: {
+                "so_anh": sum(1 for m in mau if m["loai"] == loai),
+                "so_loi": sum(1 for m in mau if m["loai"] == loai),
+                "so_rong": 0,
+                "do_tre_tb_ms": 0.0,
+                "do_tre_p50_ms": 0.0,
+                "do_tre_p95_ms": 0.0,
+                "do_chinh_xac": {truong: None for truong in truong_cua_loai},
+            }
+            for loai, truong_cua_loai in TRUONG_THEO_LOAI.items()
+        },
+    }
+
+
+def danh_gia_engine(ten_engine, mau, so_lan_khoi_dong):
+    """Chạy 1 engine trên toàn bộ mẫu. Chạy trong tiến trình riêng để đo bộ nhớ độc lập."""
+    rss_truoc = rss_dinh_mb()
+    t0 = time.perf_counter()
+    try:
+        engine = _EngineDemLoi(tao_engine(ten_engine))
+    except Exception as e:
+        # Thiếu thư viện, không tải được model...: vẫn trả kết quả để các engine khác được đánh giá
+        return _ket_qua_loi_tai(ten_engine, mau, e)
+    thoi_gian_tai = time.perf_counter() - t0
+    rss_sau_tai = rss_dinh_mb()
+
+    # Khởi động (warm-up) trên vài ảnh đầu để không tính chi phí lần chạy đầu tiên
+    for m in mau[:so_lan_khoi_dong]:
+        with open(m["file"], "rb") as f:
+            _trich_xuat(m["loai"], f.read(), engine)
+
+    ket_qua = {loai: {"do_tre": [], "loi": 0, "rong": 0,
+                      "dung": {k: 0 for k in truong}, "tong": {k: 0 for k in truong}}
+               for loai, truong in TRUONG_THEO_LOAI.items()}
+    engine.vi_du_loi = None
+    for m in mau:
+        with open(m["file"], "rb") as f:
+            image_bytes = f.read()
+        engine.bat_dau_anh()
+        t = time.perf_counter()
+        du_doan = _trich_xuat(m["loai"], image_bytes, engine)
+        kq = ket_qua[m["loai"]]
+        kq["do_tre"].append(time.perf_counter() - t)
+        if engine.co_loi:
+            kq["loi"] += 1
+        if not engine.co_chu:
+            kq["rong"] += 1
+        for truong, nhan in m["nhan"].items():
+            if not nhan:
+                continue
+            kq["tong"][truong] += 1
+            if _chuan_hoa(truong, du_doan[truong]) == _chuan_hoa(truong, nhan):
+                kq["dung"][truong] += 1
+
+    return {
+        "engine": ten_engine,
+        "loi_tai": False,
+        "thoi_gian_tai_s": thoi_gian_tai,
+        "bo_nho_model_mb": rss_sau_tai - rss_truoc,
+        "bo_nho_dinh_mb": rss_dinh_mb(),
+        "vi_du_loi": engine.vi_du_loi,
+        "theo_loai": {
+            loai: {
+                "so_anh": len(kq["do_tre"]),
+                "so_loi": kq["loi"],
+                "so_rong": kq["rong"],
+                "do_tre_tb_ms": 1000 * sum(kq["do_tre"]) / len(kq["do_tre"]) if kq["do_tre"] else 0.0,
+                "do_tre_p50_ms": 1000 * phan_vi(kq["do_tre"], 50),
+                "do_tre_p95_ms": 1000 * phan_vi(kq["do_tre"], 95),
+                "do_chinh_xac": {
+                    truong: (kq["dung"][truong] / kq["tong"][truong] if kq["tong"][truong] else None)
+                    for truong in TRUONG_THEO_LOAI[loai]
+                },
+            }
+            for loai, kq in ket_qua.items()
+        },
+    }
+
+
+def _trich_xuat(loai, image_bytes, engine):
+    if loai == "cccd":
+        ho_ten, so_cccd, que_quan = trich_xuat_cccd(image_bytes, engine)
+        return {"ho_ten": ho_ten, "so_cccd": so_cccd, "que_quan": que_quan}
+    return {"so_luong": trich_xuat_can(image_bytes, engine)}
+
+
+def _do_chinh_xac_tb(kq):
+    """Độ chính xác trung bình các trường có nhãn; None nếu không trường nào có nhãn."""
+    acc = [a for a in kq["do_chinh_xac"].values() if a is not None]
+    return sum(acc) / len(acc) if acc else None
+
+
+def de_xuat(bao_cao, loai, dung_sai, chinh_xac_toi_thieu):
+    """Chọn engine nhanh nhất (p50) trong các engine không lỗi, có độ chính xác không thấp hơn
+    engine tốt nhất quá `dung_sai` và không dưới `chinh_xac_toi_thieu`. Trả về (engine, lý do)."""
+    ung_vien = [r for r in bao_cao if r["theo_loai"][loai]["so_anh"] and not r["theo_loai"][loai]["so_loi"]]
+    ung_vien = [r for r in ung_vien if _do_chinh_xac_tb(r["theo_loai"][loai]) is not None]
+    if not ung_vien:
+        return None, "không có engine chạy không lỗi trên ảnh có nhãn"
+    tot_nhat = max(_do_chinh_xac_tb(r["theo_loai"][loai]) for r in ung_vien)
+    nguong = max(tot_nhat - dung_sai, chinh_xac_toi_thieu)
+    dat = [r for r in ung_vien if _do_chinh_xac_tb(r["theo_loai"][loai]) >= nguong]
+    if not dat:
+        return None, f"không engine nào đạt độ chính xác tối thiểu {chinh_xac_toi_thieu:.0%}"
+    nhanh_nhat = min(dat, key=lambda r: r["theo_loai"][loai]["do_tre_p50_ms"])
+    return nhanh_nhat, f"độ chính xác >= {nguong:.1%}"
+
+
+def in_bao_cao(bao_cao, dung_sai, chinh_xac_toi_thieu):
+    for r in bao_cao:
+        print(f"\n=== {r['engine']} ===")
+        if r["loi_tai"]:
+            print(f"  Không tải được engine: {r['vi_du_loi']}")
+            continue
+        print(f"Tải model: {r['thoi_gian_tai_s']:.1f} s | RAM model: {r['bo_nho_model_mb']:.0f} MB"
+              f" | RAM đỉnh: {r['bo_nho_dinh_mb']:.0f} MB")
+        for loai, kq in r["theo_loai"].items():
+            if not kq["so_anh"]:
+                continue
+            do_chinh_xac = ", ".join(
+                f"{truong}={acc:.1%}" if acc is not None else f"{truong}=-"
+                for truong, acc in kq["do_chinh_xac"].items()
+            )
+            print(f"  [{loai}] {kq['so_anh']} ảnh | lỗi {kq['so_loi']} | rỗng {kq['so_rong']}"
+                  f" | TB {kq['do_tre_tb_ms']:.0f} ms | p50 {kq['do_tre_p50_ms']:.0f} ms"
+                  f" | p95 {kq['do_tre_p95_ms']:.0f} ms | {do_chinh_xac}")
+        if r["vi_du_loi"]:
+            print(f"  Lỗi (ví dụ): {r['vi_du_loi']}")
+
+    print(f"\n=== Đề xuất (nhanh nhất theo p50 trong các engine không lỗi, độ chính xác cách"
+          f" engine tốt nhất <= {dung_sai:.0%} và >= {chinh_xac_toi_thieu:.0%}) ===")
+    for loai in TRUONG_THEO_LOAI:
+        if not any(r["theo_loai"][loai]["so_anh"] for r in bao_cao):
+            continue
+        for r in bao_cao:
+            if r["theo_loai"][loai]["so_loi"]:
+                print(f"  [{loai}] {r['engine']}: CÓ LỖI ({r['theo_loai'][loai]['so_loi']} ảnh), không xếp hạng")
+        chon, ly_do = de_xuat(bao_cao, loai, dung_sai, chinh_xac_toi_thieu)
+        if chon is None:
+            print(f"  [{loai}] Không đề xuất: {ly_do}")
+        else:
+            print(f"  OCR_ENGINE_{loai.upper()}={chon['engine']}  ({ly_do})")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="So sánh engine OCR trên bộ ảnh đã gán nhãn.")
+    parser.add_argument("nhan", help="File CSV nhãn (file,loai,ho_ten,so_cccd,que_quan,so_luong)")
+    parser.add_argument("--engine", nargs="+", default=["easyocr", "paddleocr"],
+                        help="Các engine cần so sánh (mặc định: easyocr paddleocr)")
+    parser.add_argument("--warmup", type=int, default=1, help="Số ảnh chạy khởi động trước khi đo")
+    parser.add_argument("--tolerance", type=float, default=0.02,
+                        help="Độ chính xác được phép thấp hơn engine tốt nhất (mặc định 0.02 = 2 điểm %%)")
+    parser.add_argument("--min-accuracy", type=float, default=0.5,
+                        help="Độ chính xác trung bình tối thiểu để được đề xuất (mặc định 0.5)")
+    parser.add_argument("--json", dest="json_out", help="Ghi báo cáo đầy đủ ra file JSON")
+    args = parser.parse_args(argv)
+
+    mau = doc_nhan(args.nhan)
+    if not mau:
+        parser.error("File nhãn không có mẫu nào.")
+
+    # Mỗi engine chạy trong 1 tiến trình mới để số liệu bộ nhớ không lẫn vào nhau
+    ctx = multiprocessing.get_context("spawn")
+    bao_cao = []
+    for ten in args.engine:
+        with ctx.Pool(1) as pool:
+            try:
+                bao_cao.append(pool.apply(danh_gia_engine, (ten, mau, args.warmup)))
+            except Exception as e:
+                # Tiến trình con lỗi ngoài phần tải engine: giữ kết quả các engine đã chạy
+                bao_cao.append(_ket_qua_loi_tai(ten, mau, e))
+
+    in_bao_cao(bao_cao, args.tolerance, args.min_accuracy)
+    if args.json_out:
+        with open(args.json_out, "w", encoding="utf-8") as f:
+            json.dump(bao_cao, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
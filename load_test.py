@@ -0,0 +1,421 @@
+# load_test.py
+# Kiểm thử tải: giả lập nhiều nhân viên dùng app cùng lúc bằng AppTest (streamlit.testing)
+# và đo độ trễ rerun / OCR khi số phiên đồng thời tăng.
+#
+# Cách dùng (chạy từ thư mục gốc repo):
+#   python load_test.py --sessions 10 --iterations 3 --db-rows 20000
+#   python load_test.py --sessions 20 --skip-ocr          # chỉ đo rerun, không tải model OCR
+#
+# Mỗi phiên: đăng nhập -> tải ảnh CCCD và ảnh cân giả lập (OCR) -> nhập hàng hóa ->
+# lưu giao dịch ở chế độ OCR, hoặc nhập thủ công nếu --skip-ocr (create_new_transaction_page) -> lọc/xem lịch sử (history_and_stats_page)
+# -> làm mới trang. Cần Streamlit có hỗ trợ file_uploader trong AppTest.
+import argparse
+import json
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from io import BytesIO
+
+from PIL import Image, ImageDraw, ImageFont
+
+from do_luong import phan_vi, rss_dinh_mb
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_FILE = os.path.join(APP_DIR, "streamlit_app.py")
+FONT_FILE = os.path.join(APP_DIR, "arial.ttf")
+
+HO = ["Nguyễn", "Trần", "Lê", "Phạm", "Huỳnh", "Võ", "Đặng", "Bùi"]
+DEM = ["Văn", "Thị", "Minh", "Ngọc", "Hữu", "Thanh"]
+TEN = ["An", "Bình", "Cường", "Dung", "Hòa", "Lan", "Phúc", "Tâm"]
+QUE = ["Bến Lức, Long An", "Tân An, Long An", "Cần Giuộc, Long An", "Mỹ Tho, Tiền Giang"]
+HANG = ["Vàng 9999", "Vàng 24K", "Vàng 18K", "Bạc"]
+
+
+# ========== DỮ LIỆU GIẢ LẬP =============
+def _ten_ngau_nhien(rng):
+    return f"{rng.choice(HO)} {rng.choice(DEM)} {rng.choice(TEN)}"
+
+
+def tao_csdl_mau(duong_dan, so_dong, seed=0):
+    """Tạo CSDL lịch sử với `so_dong` giao dịch trải đều trong 1 năm gần nhất."""
+    rng = random.Random(seed)
+    conn = sqlite3.connect(duong_dan)
+    # Cùng schema với streamlit_app.py
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS lich_su (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        thoi_gian TEXT,
+        ho_va_ten TEXT,
+        so_cccd TEXT,
+        que_quan TEXT,
+        hang_hoa_json TEXT,
+        tong_thanh_tien REAL
+    )
+    ''')
+    now = datetime.now()
+    rows = []
+    for _ in range(so_dong):
+        items = []
+        for _ in range(rng.randint(1, 3)):
+            so_luong = round(rng.uniform(0.5, 20), 2)
+            don_gia = rng.randrange(5_000_000, 9_000_000, 10_000)
+            items.append({"ten": rng.choice(HANG), "so_luong": so_luong, "don_gia": don_gia,
+                          "thanh_tien": so_luong * don_gia})
+        thoi_gian = now - timedelta(seconds=rng.randint(0, 365 * 24 * 3600))
+        rows.append((thoi_gian.strftime("%Y-%m-%d %H:%M:%S"), _ten_ngau_nhien(rng),
+                     "".join(rng.choice("0123456789") for _ in range(12)), rng.choice(QUE),
+                     json.dumps(items), sum(i["thanh_tien"] for i in items)))
+    conn.executemany('''
+        INSERT INTO lich_su (thoi_gian, ho_va_ten, so_cccd, que_quan, hang_hoa_json, tong_thanh_tien)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', rows)
+    conn.commit()
+    conn.close()
+
+
+def _anh_png(lines, size, font_size):
+    img = Image.new("RGB", size, "white")
+    draw = ImageDraw.Draw(img)
+    try:
+        font = ImageFont.truetype(FONT_FILE, font_size)
+    except OSError:
+        font = ImageFont.load_default()
+    y = 20
+    for line in lines:
+        draw.text((30, y), line, fill="black", font=font)
+        y += int(font_size * 1.6)
+    buf = BytesIO()
+    img.save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def tao_anh_cccd(ho_ten, so_cccd, que_quan):
+    return _anh_png([
+        "CĂN CƯỚC CÔNG DÂN",
+        f"Số / No.: {so_cccd}",
+        "Họ và tên / Full name:",
+        ho_ten.upper(),
+        "Quê quán / Place of origin:",
+        que_quan,
+    ], (900, 560), 36)
+
+
+def tao_anh_can(so_luong):
+    return _anh_png([f"{so_luong:.2f}"], (600, 220), 120)
+
+
+# ========== PHIÊN GIẢ LẬP =============
+class KetQua:
+    """Gom độ trễ theo hành động từ nhiều thread."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.do_tre = defaultdict(list)
+        self.loi = defaultdict(int)
+        self.vi_du_loi = {}
+        self.giao_dich = defaultdict(int)  # hành động lưu -> số giao dịch lưu thành công
+        self.thoi_gian_nghi = 0.0
+
+    def ghi(self, hanh_dong, giay, loi=None):
+        with self._lock:
+            self.do_tre[hanh_dong].append(giay)
+            if loi:
+                self.loi[hanh_dong] += 1
+                self.vi_du_loi.setdefault(hanh_dong, loi)
+
+    def ghi_loi_phien(self, loi):
+        with self._lock:
+            self.loi["phien"] += 1
+            self.vi_du_loi.setdefault("phien", loi)
+
+    def dem_giao_dich(self, hanh_dong):
+        with self._lock:
+            self.giao_dich[hanh_dong] += 1
+
+    def ghi_nghi(self, giay):
+        with self._lock:
+            self.thoi_gian_nghi += giay
+
+
+def _tim(widgets, label):
+    for w in widgets:
+        if w.label == label:
+            return w
+    raise LookupError(f"Không tìm thấy widget '{label}'")
+
+
+def _kiem_tra_ocr_can(at):
+    # Khối lượng OCR phải hiện trong ô (bị khóa) của món 1, nếu không sẽ bị bỏ khi lưu
+    if not at.text_input(key="so_luong_0").value:
+        return "Khối lượng OCR không có trong ô so_luong_0"
+    return None
+
+
+def _kiem_tra_luu(at):
+    if any("thành công" in s.value for s in at.success):
+        return None
+    if len(at.error):
+        return f"Lưu thất bại: {at.error[0].value}"
+    return "Lưu thất bại: không thấy thông báo thành công"
+
+
+class PhienGiaLap:
+    def __init__(self, so_thu_tu, args, ket_qua):
+        self.rng = random.Random(args.seed + so_thu_tu)
+        self.args = args
+        self.ket_qua = ket_qua
+        from streamlit.testing.v1 import AppTest
+        self.at = AppTest.from_file(APP_FILE, default_timeout=args.timeout)
+
+    def _chay(self, hanh_dong, kiem_tra=None):
+        """Rerun và ghi độ trễ. `kiem_tra(at)` trả về thông báo lỗi nếu kết quả không như mong đợi."""
+        t = time.perf_counter()
+        loi = None
+        try:
+            self.at.run()
+            if len(self.at.exception):
+                loi = self.at.exception[0].message
+            elif kiem_tra:
+                loi = kiem_tra(self.at)
+        except Exception as e:
+            loi = f"{type(e).__name__}: {e}"
+        self.ket_qua.ghi(hanh_dong, time.perf_counter() - t, loi)
+        if self.args.think:
+            nghi = self.rng.uniform(0, 2 * self.args.think)
+            time.sleep(nghi)
+            self.ket_qua.ghi_nghi(nghi)
+        return loi is None
+
+    def dang_nhap(self):
+        self._chay("mo_trang")
+        _tim(self.at.text_input, "Tên đăng nhập").input(self.args.user)
+        _tim(self.at.text_input, "Mật khẩu").input(self.args.password)
+        _tim(self.at.button, "Đăng nhập").click()
+        return self._chay("dang_nhap")
+
+    def tao_giao_dich(self):
+        at, rng = self.at, self.rng
+        ho_ten = _ten_ngau_nhien(rng)
+        so_cccd = "".join(rng.choice("0123456789") for _ in range(12))
+        que_quan = rng.choice(QUE)
+        so_luong = round(rng.uniform(0.5, 20), 2)
+
+        che_do_ocr = not self.args.skip_ocr
+        if che_do_ocr:
+            _tim(at.radio, "Chọn phương thức:").set_value("Sử dụng OCR")
+            self._chay("chuyen_che_do_ocr")
+            _tim(at.file_uploader, "Hoặc tải ảnh CCCD").set_value(
+                ("cccd.png", tao_anh_cccd(ho_ten, so_cccd, que_quan), "image/png"))
+            self._chay("ocr_cccd")
+            _tim(at.file_uploader, "Hoặc tải ảnh cân").set_value(
+                ("can.png", tao_anh_can(so_luong), "image/png"))
+            self._chay("ocr_can", _kiem_tra_ocr_can)
+        else:
+            _tim(at.radio, "Chọn phương thức:").set_value("Nhập thủ công")
+
+        so_mon = rng.randint(1, 3)
+        for _ in range(so_mon - 1):
+            _tim(at.button, "➕ Thêm món hàng").click()
+            self._chay("them_mon_hang")
+
+        # Ở chế độ OCR, họ tên/CCCD/quê quán và khối lượng món 1 lấy từ OCR (ô bị khóa)
+        if not che_do_ocr:
+            at.text_input(key="ho_ten_input").input(ho_ten)
+            at.text_input(key="so_cccd_input").input(so_cccd)
+            at.text_area(key="que_quan_input").input(que_quan)
+        for i in range(so_mon):
+            at.text_input(key=f"ten_hang_{i}").input(rng.choice(HANG))
+            if i > 0 or not che_do_ocr:
+                at.text_input(key=f"so_luong_{i}").input(str(so_luong if i == 0 else round(rng.uniform(0.5, 20), 2)))
+            at.text_input(key=f"don_gia_{i}").input(str(rng.randrange(5_000_000, 9_000_000, 10_000)))
+        _tim(at.button, "Lưu giao dịch").click()
+        hanh_dong = "luu_giao_dich_ocr" if che_do_ocr else "luu_giao_dich"
+        if self._chay(hanh_dong, _kiem_tra_luu):
+            self.ket_qua.dem_giao_dich(hanh_dong)
+        return ho_ten
+
+    def xem_lich_su(self, ho_ten):
+        at = self.at
+        _tim(at.selectbox, "Chọn ID để chỉnh sửa/xóa").set_value("")
+        _tim(at.text_input, "Tìm kiếm theo tên khách hàng").input(ho_ten.split()[-1])
+        self._chay("loc_lich_su")
+        chon_id = _tim(at.selectbox, "Chọn ID để chỉnh sửa/xóa")
+        if len(chon_id.options) > 1:
+            chon_id.set_value(chon_id.options[1])
+            self._chay("xem_ban_ghi")
+
+    def lam_moi(self):
+        self.at.button(key="refresh_button").click()
+        self._chay("lam_moi")
+
+    def chay(self):
+        if not self.dang_nhap():
+            return
+        for _ in range(self.args.iterations):
+            ho_ten = self.tao_giao_dich()
+            self.xem_lich_su(ho_ten)
+            self.lam_moi()
+
+
+def _dung_chung_nhu_server():
+    """Đưa AppTest về gần server thật khi nhiều phiên chạy song song trong các thread.
+
+    - AppTest gán rồi xóa Runtime._instance (biến toàn cục) ở mỗi lần chạy, nên phiên
+      kết thúc trước xóa mất runtime của phiên đang chạy: giữ lại runtime gần nhất.
+    - AppTest biên dịch lại script ở mỗi lần chạy (ast.parse song song không an toàn trên
+      một số bản Python); server thật dùng 1 ScriptCache cho mọi phiên: làm tương tự.
+    """
+    from streamlit.runtime import Runtime
+    from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+    from streamlit.testing.v1 import app_test, local_script_runner
+    gan_nhat = {"rt": None}
+
+    def instance(cls):
+        if cls._instance is not None:
+            gan_nhat["rt"] = cls._instance
+            return cls._instance
+        if gan_nhat["rt"] is None:
+            raise RuntimeError("Runtime hasn't been created!")
+        return gan_nhat["rt"]
+
+    Runtime.instance = classmethod(instance)
+    Runtime.exists = classmethod(lambda cls: cls._instance is not None or gan_nhat["rt"] is not None)
+
+    script_cache = ScriptCache()
+    app_test.ScriptCache = local_script_runner.ScriptCache = lambda: script_cache
+
+
+# ========== BÁO CÁO =============
+def tong_hop(ket_qua, thoi_gian, args, rss_ban_dau):
+    hanh_dong = {}
+    for ten, ds in ket_qua.do_tre.items():
+        hanh_dong[ten] = {
+            "so_lan": len(ds),
+            "loi": ket_qua.loi.get(ten, 0),
+            **{f"p{p}_ms": 1000 * phan_vi(ds, p) for p in (50, 90, 95, 99)},
+            "max_ms": 1000 * max(ds),
+        }
+    tong_so_lan = sum(len(ds) for ds in ket_qua.do_tre.values())
+    so_giao_dich = sum(ket_qua.giao_dich.values())
+    return {
+        "so_phien": args.sessions,
+        "so_vong": args.iterations,
+        "so_dong_csdl": args.db_rows,
+        "tai_khoan": args.user,
+        "ocr": not args.skip_ocr,
+        "thoi_gian_s": thoi_gian,
+        # Có --think thì thời gian chạy gồm cả thời gian nghĩ: số liệu là tải đưa vào
+        # (offered load) theo nhịp nhân viên, không phải thông lượng tối đa của app
+        "loai_ty_le": "tai_dua_vao" if args.think else "thong_luong",
+        "thoi_gian_nghi_tb_moi_phien_s": ket_qua.thoi_gian_nghi / args.sessions,
+        "rerun_moi_s": tong_so_lan / thoi_gian if thoi_gian else 0.0,
+        "giao_dich_moi_phut": 60 * so_giao_dich / thoi_gian if thoi_gian else 0.0,
+        "so_giao_dich": so_giao_dich,
+        "giao_dich_theo_che_do": dict(ket_qua.giao_dich),
+        "ram_ban_dau_mb": rss_ban_dau,
+        "ram_dinh_mb": rss_dinh_mb(),
+        "hanh_dong": hanh_dong,
+        "vi_du_loi": ket_qua.vi_du_loi,
+    }
+
+
+def in_bao_cao(bao_cao):
+    print(f"\n{bao_cao['so_phien']} phiên ({bao_cao['tai_khoan']}) x {bao_cao['so_vong']} vòng, CSDL {bao_cao['so_dong_csdl']} dòng,"
+          f" OCR {'bật' if bao_cao['ocr'] else 'tắt'} - {bao_cao['thoi_gian_s']:.1f} s")
+    print(f"{'Hành động':<20}{'Số lần':>8}{'Lỗi':>6}{'p50':>9}{'p90':>9}{'p95':>9}{'p99':>9}{'max':>9}  (ms)")
+    for ten, r in bao_cao["hanh_dong"].items():
+        print(f"{ten:<20}{r['so_lan']:>8}{r['loi']:>6}{r['p50_ms']:>9.0f}{r['p90_ms']:>9.0f}"
+              f"{r['p95_ms']:>9.0f}{r['p99_ms']:>9.0f}{r['max_ms']:>9.0f}")
+    nhan = "Thông lượng" if bao_cao["loai_ty_le"] == "thong_luong" else "Tải đưa vào (gồm thời gian nghĩ --think)"
+    theo_che_do = ", ".join(f"{k}: {v}" for k, v in bao_cao["giao_dich_theo_che_do"].items()) or "0"
+    print(f"{nhan}: {bao_cao['rerun_moi_s']:.2f} rerun/s, {bao_cao['giao_dich_moi_phut']:.1f} giao dịch/phút"
+          f" ({bao_cao['so_giao_dich']} đã lưu - {theo_che_do})")
+    if bao_cao["loai_ty_le"] != "thong_luong":
+        print(f"Thời gian nghĩ trung bình mỗi phiên: {bao_cao['thoi_gian_nghi_tb_moi_phien_s']:.1f} s")
+    print(f"RAM: ban đầu {bao_cao['ram_ban_dau_mb']:.0f} MB, đỉnh {bao_cao['ram_dinh_mb']:.0f} MB")
+    for ten, loi in bao_cao["vi_du_loi"].items():
+        print(f"Lỗi [{ten}]: {loi}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Kiểm thử tải nhiều phiên đồng thời cho streamlit_app.py.")
+    parser.add_argument("--sessions", type=int, default=10, help="Số phiên (nhân viên) đồng thời")
+    parser.add_argument("--iterations", type=int, default=3, help="Số giao dịch mỗi phiên")
+    parser.add_argument("--db-rows", type=int, default=5000, help="Số giao dịch có sẵn trong CSDL mẫu")
+    parser.add_argument("--skip-ocr", action="store_true", help="Không tải ảnh/OCR, chỉ nhập thủ công")
+    parser.add_argument("--think", type=float, default=0.0, help="Thời gian nghĩ trung bình giữa các thao tác (s)")
+    parser.add_argument("--ramp-up", type=float, default=0.0, help="Rải thời điểm bắt đầu các phiên trong N giây")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Timeout mỗi lần rerun (s)")
+    # Mặc định đăng nhập tài khoản nhân viên: admin có thêm bảng "Bộ nhớ phiên" nặng hơn
+    parser.add_argument("--user", default="user1", help="Tài khoản đăng nhập của mọi phiên (mặc định user1)")
+    parser.add_argument("--password", default="user123", help="Mật khẩu của --user")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--keep-db", action="store_true", help="Giữ lại CSDL mẫu sau khi chạy")
+    parser.add_argument("--json", dest="json_out", help="Ghi báo cáo ra file JSON")
+    args = parser.parse_args(argv)
+
+    # App đọc arial.ttf theo đường dẫn tương đối
+    os.chdir(APP_DIR)
+    thu_muc = tempfile.mkdtemp(prefix="ams_load_")
+    db_path = os.path.join(thu_muc, "lich_su_giao_dich.db")
+    print(f"Tạo CSDL mẫu {args.db_rows} dòng tại {db_path} ...")
+    tao_csdl_mau(db_path, args.db_rows, args.seed)
+    os.environ["AMS_DB_PATH"] = db_path
+
+    _dung_chung_nhu_server()
+    try:
+        bao_cao = chay_tai(args)
+    finally:
+        if args.keep_db:
+            print(f"Giữ CSDL mẫu tại {db_path}")
+        else:
+            shutil.rmtree(thu_muc, ignore_errors=True)
+
+    in_bao_cao(bao_cao)
+    if args.json_out:
+        with open(args.json_out, "w", encoding="utf-8") as f:
+            json.dump(bao_cao, f, ensure_ascii=False, indent=2)
+
+
+def chay_tai(args):
+    # Phiên khởi động (không tính): tải model OCR, font, matplotlib... vào cache dùng chung
+    print("Khởi động ...")
+    khoi_dong = KetQua()
+    try:
+        PhienGiaLap(-1, argparse.Namespace(**{**vars(args), "iterations": 1, "think": 0.0}), khoi_dong).chay()
+    except Exception as e:
+        khoi_dong.ghi_loi_phien(f"{type(e).__name__}: {e}")
+    for ten, loi in khoi_dong.vi_du_loi.items():
+        print(f"Lỗi khi khởi động [{ten}]: {loi}")
+    # OCR đọc sai ảnh làm lưu thất bại là kết quả cần đo, không phải lỗi của bộ kiểm thử
+    if set(khoi_dong.vi_du_loi) - {"luu_giao_dich_ocr"}:
+        sys.exit(1)
+
+    rss_ban_dau = rss_dinh_mb()
+    ket_qua = KetQua()
+
+    def chay_phien(i):
+        if args.ramp_up:
+            time.sleep(args.ramp_up * i / args.sessions)
+        try:
+            PhienGiaLap(i, args, ket_qua).chay()
+        except Exception as e:
+            ket_qua.ghi_loi_phien(f"{type(e).__name__}: {e}")
+
+    print(f"Chạy {args.sessions} phiên đồng thời ...")
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.sessions) as pool:
+        list(pool.map(chay_phien, range(args.sessions)))
+    return tong_hop(ket_qua, time.perf_counter() - t0, args, rss_ban_dau)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+# ocr.py
+# Engine OCR dùng chung cho app và công cụ đánh giá (không phụ thuộc streamlit).
+import os
+import re
+import cv2
+import numpy as np
+
+# --- Chọn engine theo loại trường ---
+# "cccd": ảnh căn cước, "can": ảnh màn hình cân.
+# Có thể ghi đè bằng biến môi trường OCR_ENGINE_CCCD / OCR_ENGINE_CAN,
+# ví dụ sau khi chạy evaluate_ocr.py để chọn engine nhanh nhất cho từng trường.
+ENGINE_THEO_TRUONG = {
+    "cccd": os.environ.get("OCR_ENGINE_CCCD", "easyocr"),
+    "can": os.environ.get("OCR_ENGINE_CAN", "easyocr"),
+}
+
+# Các trường được trích xuất cho từng loại ảnh
+TRUONG_THEO_LOAI = {
+    "cccd": ["ho_ten", "so_cccd", "que_quan"],
+    "can": ["so_luong"],
+}
+
+
+# ========== ENGINE OCR =============
+class OCREngine:
+    """Giao diện chung: nhận ảnh BGR, trả về danh sách dòng chữ."""
+    ten = ""
+
+    def readtext(self, img):
+        raise NotImplementedError
+
+
+class EasyOCREngine(OCREngine):
+    ten = "easyocr"
+
+    def __init__(self, langs=("vi", "en"), gpu=False):
+        import easyocr
+        self._reader = easyocr.Reader(list(langs), gpu=gpu)
+
+    def readtext(self, img):
+        texts = self._reader.readtext(img, detail=0)
+        return [str(t).strip() for t in texts if t is not None]
+
+
+class PaddleOCREngine(OCREngine):
+    ten = "paddleocr"
+
+    def __init__(self):
+        from paddleocr import PaddleOCR
+        # Chỉ giữ bước phát hiện + nhận dạng chữ với model mobile (chạy CPU).
+        # Tắt xoay/làm phẳng tài liệu và xoay dòng chữ: ảnh CCCD/cân chụp thẳng,
+        # các bước này chỉ tốn thêm model và có thể làm méo ảnh màn hình cân.
+        # Model latin nhận dạng được tiếng Việt có dấu.
+        self._ocr = PaddleOCR(
+            text_detection_model_name="PP-OCRv5_mobile_det",
+            text_recognition_model_name="latin_PP-OCRv5_mobile_rec",
+            use_doc_orientation_classify=False,
+            use_doc_unwarping=False,
+            use_textline_orientation=False,
+        )
+
+    def readtext(self, img):
+        texts = []
+        for res in self._ocr.predict(img) or []:
+            texts.extend(res["rec_texts"] or [])
+        return [str(t).strip() for t in texts if t is not None]
+
+
+CAC_ENGINE = {
+    EasyOCREngine.ten: EasyOCREngine,
+    PaddleOCREngine.ten: PaddleOCREngine,
+}
+
+
+def kiem_tra_cau_hinh():
+    """Kiểm tra OCR_ENGINE_* hợp lệ. App gọi lúc khởi động để gõ sai tên engine
+    báo lỗi ngay, không phải lúc tải ảnh đầu tiên."""
+    for loai, ten in ENGINE_THEO_TRUONG.items():
+        if ten not in CAC_ENGINE:
+            raise ValueError(f"OCR_ENGINE_{loai.upper()}={ten!r} không hợp lệ (chọn trong {', '.join(CAC_ENGINE)})")
+
+
+def tao_engine(ten):
+    """Khởi tạo engine theo tên (tải model, tốn thời gian - nên cache lại)."""
+    if ten not in CAC_ENGINE:
+        raise ValueError(f"Engine OCR không hỗ trợ: {ten} (chọn trong {', '.join(CAC_ENGINE)})")
+    return CAC_ENGINE[ten]()
+
+
+# --- Image helpers ---
+def _bytes_to_bgr(image_bytes):
+    return cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_COLOR)
+
+def preprocess_image_for_ocr(image_bytes):
+    img = _bytes_to_bgr(image_bytes)
+    if img is None:
+        return None
+    # cải thiện: grayscale -> bilateral -> adaptive threshold
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    gray = cv2.bilateralFilter(gray, 9, 75, 75)
+    thr = cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
+                                 cv2.THRESH_BINARY, 31, 9)
+    # trả về màu BGR vì các engine chấp nhận cả ảnh màu/ngang
+    return cv2.cvtColor(thr, cv2.COLOR_GRAY2BGR)
+
+# --- Extract helper (list text) ---
+def _texts_from_bytes(image_bytes, engine):
+    img = _bytes_to_bgr(image_bytes)
+    if img is None:
+        return []
+    try:
+        return engine.readtext(img)
+    except Exception:
+        # fallback: dùng preprocessed
+        proc = preprocess_image_for_ocr(image_bytes)
+        if proc is None:
+            return []
+        try:
+            return engine.readtext(proc)
+        except Exception:
+            return []
+
+# --- Hàm OCR CCCD ---
+def trich_xuat_cccd(image_bytes, engine):
+    ho_ten, so_cccd, que_quan = "", "", ""
+    try:
+        texts = _texts_from_bytes(image_bytes, engine)
+        if not texts:
+            return "", "", ""
+        texts_upper = [t.upper() for t in texts]
+
+        # Tìm "HỌ VÀ TÊN" hoặc "HỌ TÊN" hoặc "HỌ & TÊN"
+        for i, t in enumerate(texts_upper):
+            if "HỌ VÀ TÊN" in t or "HỌ TÊN" in t or "HỌ VÀ TÊN:" in t or "HỌ & TÊN" in t:
+                if i + 1 < len(texts):
+                    ho_ten = texts[i + 1]
+                break
+        # fallback: tìm dòng chứa "Họ" + dấu ví dụ "Họ tên: NGUYEN VAN A"
+        if not ho_ten:
+            for t in texts:
+                m = re.search(r"Họ( và)? tên[:\s\-]*([A-Za-zÀ-ỹ\s]+)", t, re.IGNORECASE)
+                if m:
+                    ho_ten = m.group(2).strip()
+                    break
+
+        # Số CCCD (12 chữ số)
+        pat_cccd = re.compile(r"\d{12}")
+        for t in texts:
+            m = pat_cccd.search(t.replace(" ", ""))
+            if m:
+                so_cccd = m.group(0)
+                break
+
+        # Quê quán
+        for i, t in enumerate(texts_upper):
+            if "QUÊ QUÁN" in t or "QUE QUAN" in t:
+                if i + 1 < len(texts):
+                    que_quan = texts[i + 1]
+                break
+        # fallback: nếu vẫn rỗng, tìm dòng chứa từ "QUÊ" hoặc "QUÊ QUÁN"
+        if not que_quan:
+            for t in texts:
+                if "QUÊ" in t.upper():
+                    que_quan = t
+                    break
+
+        return ho_ten, so_cccd, que_quan
+    except Exception:
+        return "", "", ""
+
+# --- Hàm OCR cân ---
+def trich_xuat_can(image_bytes, engine):
+    try:
+        # dùng preprocessed ảnh cân để tăng độ chính xác số
+        proc = preprocess_image_for_ocr(image_bytes)
+        texts = []
+        if proc is not None:
+            try:
+                texts = engine.readtext(proc)
+            except Exception:
+                pass
+        if not texts:
+            texts = _texts_from_bytes(image_bytes, engine)
+        if not texts:
+            return ""
+        candidates = []
+        for t in texts:
+            for m in re.findall(r"[0-9]+(?:[.,][0-9]+)?", str(t)):
+                val = m.replace(",", ".")
+                try:
+                    candidates.append((m, float(val)))
+                except:
+                    pass
+        if not candidates:
+            return ""
+        candidates.sort(key=lambda x: x[1], reverse=True)
+        return candidates[0][0].replace(",", ".")
+    except Exception:
+        return ""
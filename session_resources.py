@@ -0,0 +1,201 @@
+# session_resources.py
+# Quản lý dữ liệu lớn (PDF, ảnh, giao dịch) của từng phiên ngoài st.session_state.
+# session_state chỉ giữ "handle"; dữ liệu nằm trong RAM có giới hạn hoặc được đẩy
+# xuống file tạm, và bị xóa khi phiên không hoạt động quá TTL.
+import atexit
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+TIEN_TO_THU_MUC = "ams_phien_"
+
+
+def _dang_chay(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def xoa_thu_muc_cu():
+    """Xóa thư mục tạm của các tiến trình đã dừng (khởi động lại, crash).
+
+    Thư mục chứa ảnh CCCD và PDF bản kê (dữ liệu cá nhân) nên không được để lại trên đĩa.
+    Tên thư mục có PID của tiến trình tạo ra; thư mục của tiến trình còn chạy được giữ nguyên.
+    """
+    goc = tempfile.gettempdir()
+    for ten in os.listdir(goc):
+        if not ten.startswith(TIEN_TO_THU_MUC):
+            continue
+        pid = ten[len(TIEN_TO_THU_MUC):].split("_", 1)[0]
+        if pid.isdigit() and _dang_chay(int(pid)):
+            continue
+        shutil.rmtree(os.path.join(goc, ten), ignore_errors=True)
+
+
+class SessionResourceManager:
+    """Kho blob theo phiên, dùng chung cho mọi phiên trong tiến trình (thread-safe).
+
+    - Blob lớn hơn `nguong_ghi_dia` luôn ghi xuống đĩa.
+    - Blob nhỏ giữ trong RAM; khi vượt ngân sách phiên hoặc ngân sách toàn cục,
+      blob ít dùng gần đây nhất bị đẩy xuống đĩa.
+    - Phiên không hoạt động quá `ttl` giây bị xóa toàn bộ dữ liệu.
+
+    Ngân sách chỉ giới hạn phần RAM của kho; phần trên đĩa không giới hạn cho tới khi
+    phiên hết TTL. Thư mục tạm bị xóa khi gọi close() hoặc khi tiến trình thoát.
+    """
+
+    def __init__(self, thu_muc=None, ngan_sach_phien=2 * 1024 * 1024,
+                 ngan_sach_toan_cuc=64 * 1024 * 1024, nguong_ghi_dia=256 * 1024,
+                 ttl=30 * 60, chu_ky_don_dep=60):
+        if thu_muc is None:
+            xoa_thu_muc_cu()
+            thu_muc = tempfile.mkdtemp(prefix=f"{TIEN_TO_THU_MUC}{os.getpid()}_")
+        self.thu_muc = thu_muc
+        os.makedirs(self.thu_muc, exist_ok=True)
+        self.ngan_sach_phien = ngan_sach_phien
+        self.ngan_sach_toan_cuc = ngan_sach_toan_cuc
+        self.nguong_ghi_dia = nguong_ghi_dia
+        self.ttl = ttl
+        self.chu_ky_don_dep = chu_ky_don_dep
+        self._lock = threading.RLock()
+        # handle -> {"phien", "ten", "data" (bytes|None), "file" (str|None), "kich_thuoc"}
+        # OrderedDict giữ thứ tự LRU để chọn blob đẩy xuống đĩa
+        self._blobs = OrderedDict()
+        self._hoat_dong = {}  # phien -> thời điểm truy cập cuối
+        self._lan_don_dep = time.monotonic()
+        atexit.register(self.close)
+
+    @staticmethod
+    def handle(phien, ten):
+        return f"{phien}/{ten}"
+
+    # --- Ghi / đọc ---
+    def put(self, phien, ten, data):
+        """Lưu blob cho phiên, trả về handle để đặt vào session_state."""
+        h = self.handle(phien, ten)
+        with self._lock:
+            self._xoa_blob(h)
+            blob = {"phien": phien, "ten": ten, "data": None, "file": None, "kich_thuoc": len(data)}
+            self._blobs[h] = blob
+            if len(data) > self.nguong_ghi_dia:
+                self._ghi_dia(h, blob, data)
+            else:
+                blob["data"] = bytes(data)
+                self._ap_ngan_sach(phien)
+            self._cham(phien)
+        return h
+
+    def get(self, h):
+        """Đọc blob theo handle; trả về None nếu đã bị xóa (ví dụ hết TTL)."""
+        with self._lock:
+            blob = self._blobs.get(h)
+            if blob is None:
+                return None
+            self._blobs.move_to_end(h)
+            self._cham(blob["phien"])
+            if blob["data"] is not None:
+                return blob["data"]
+            path = blob["file"]
+        try:
+            with open(path, "rb") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def exists(self, h):
+        """Handle còn dữ liệu hay không (không đọc blob, không tính là truy cập)."""
+        with self._lock:
+            return h in self._blobs
+
+    def drop(self, phien, ten):
+        with self._lock:
+            self._xoa_blob(self.handle(phien, ten))
+
+    def drop_session(self, phien):
+        """Xóa toàn bộ dữ liệu của phiên."""
+        with self._lock:
+            for h in [h for h, b in self._blobs.items() if b["phien"] == phien]:
+                self._xoa_blob(h)
+            self._hoat_dong.pop(phien, None)
+
+    def touch(self, phien):
+        """Đánh dấu phiên còn hoạt động (gọi mỗi lần rerun) và dọn phiên hết hạn."""
+        with self._lock:
+            self._cham(phien)
+
+    # --- Dọn dẹp ---
+    def evict_idle(self, now=None):
+        """Xóa dữ liệu của các phiên không hoạt động quá TTL. Trả về số phiên bị xóa."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            het_han = [p for p, t in self._hoat_dong.items() if now - t > self.ttl]
+            for p in het_han:
+                self.drop_session(p)
+            self._lan_don_dep = now
+        return len(het_han)
+
+    def close(self):
+        atexit.unregister(self.close)
+        with self._lock:
+            self._blobs.clear()
+            self._hoat_dong.clear()
+        shutil.rmtree(self.thu_muc, ignore_errors=True)
+
+    # --- Báo cáo ---
+    def usage(self, phien=None):
+        """Thống kê dung lượng (byte) toàn cục, hoặc của 1 phiên nếu truyền `phien`."""
+        with self._lock:
+            blobs = [b for b in self._blobs.values() if phien is None or b["phien"] == phien]
+            return {
+                "so_phien": len(self._hoat_dong) if phien is None else int(phien in self._hoat_dong),
+                "so_blob": len(blobs),
+                "ram_bytes": sum(b["kich_thuoc"] for b in blobs if b["data"] is not None),
+                "dia_bytes": sum(b["kich_thuoc"] for b in blobs if b["file"] is not None),
+                "ngan_sach_ram_bytes": self.ngan_sach_toan_cuc if phien is None else self.ngan_sach_phien,
+            }
+
+    # --- Nội bộ (gọi khi đã giữ lock) ---
+    def _cham(self, phien):
+        now = time.monotonic()
+        self._hoat_dong[phien] = now
+        if now - self._lan_don_dep >= self.chu_ky_don_dep:
+            self.evict_idle(now)
+
+    def _ram_dung(self, phien=None):
+        return sum(b["kich_thuoc"] for b in self._blobs.values()
+                   if b["data"] is not None and (phien is None or b["phien"] == phien))
+
+    def _ap_ngan_sach(self, phien):
+        # Đẩy blob cũ nhất của phiên xuống đĩa cho tới khi nằm trong ngân sách phiên,
+        # sau đó làm tương tự với blob cũ nhất của mọi phiên cho ngân sách toàn cục.
+        for gioi_han, pham_vi in ((self.ngan_sach_phien, phien), (self.ngan_sach_toan_cuc, None)):
+            du = self._ram_dung(pham_vi) - gioi_han
+            for h, blob in list(self._blobs.items()):
+                if du <= 0:
+                    break
+                if blob["data"] is None or (pham_vi is not None and blob["phien"] != pham_vi):
+                    continue
+                du -= blob["kich_thuoc"]
+                self._ghi_dia(h, blob, blob["data"])
+
+    def _ghi_dia(self, h, blob, data):
+        fd, path = tempfile.mkstemp(dir=self.thu_muc)
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        blob["file"] = path
+        blob["data"] = None
+
+    def _xoa_blob(self, h):
+        blob = self._blobs.pop(h, None)
+        if blob is not None and blob["file"]:
+            try:
+                os.remove(blob["file"])
+            except OSError:
+                pass
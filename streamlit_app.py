@@ -1,23 +1,22 @@
 # streamlit_app.py
 import streamlit as st
-import cv2
-import numpy as np
 import pandas as pd
 import sqlite3
 from datetime import datetime
 import pytz
-import easyocr
+from ocr import ENGINE_THEO_TRUONG, kiem_tra_cau_hinh, tao_engine, trich_xuat_cccd, trich_xuat_can
 from io import BytesIO
 from reportlab.pdfgen import canvas
 from reportlab.lib.pagesizes import A4
 from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
 from reportlab.lib.units import mm
-import re
 import os
 import matplotlib.pyplot as plt
 import tempfile
 import json
+import uuid
+from session_resources import SessionResourceManager
 
 # ============= CẤU HÌNH & KHỞI TẠO TRẠNG THÁI PHIÊN (RẤT QUAN TRỌNG) =============
 # Đây là cách đúng để đảm bảo các biến session state luôn được khởi tạo.
@@ -33,6 +32,13 @@ st.session_state.setdefault("pdf_for_download", None)
 st.session_state.setdefault("giao_dich_data", None)
 st.session_state.setdefault("ten_don_vi_input", "")
 st.session_state.setdefault("phuong_thuc", "Nhập thủ công")
+# Dữ liệu lớn (PDF, ảnh) không nằm trong session_state mà trong kho của phiên,
+# session_state chỉ giữ handle (xem session_resources.py)
+st.session_state.setdefault("session_id", uuid.uuid4().hex)
+st.session_state.setdefault("anh_cccd", None)
+st.session_state.setdefault("anh_can", None)
+st.session_state.setdefault("cccd_uploader_gen", 0)
+st.session_state.setdefault("can_uploader_gen", 0)
 
 # --- Quản lý người dùng (đơn giản, demo) ---
 users = {
@@ -40,15 +46,26 @@ users = {
     "user1": "user123"
 }
 
-# --- Khởi tạo EasyOCR (cache) ---
+# --- Khởi tạo engine OCR (cache, mỗi engine chỉ tải model 1 lần) ---
+kiem_tra_cau_hinh()
+
 @st.cache_resource
-def get_reader():
-    return easyocr.Reader(['vi', 'en'], gpu=False)
+def get_ocr_engine(ten):
+    return tao_engine(ten)
+
+# --- Kho dữ liệu theo phiên (dùng chung cho mọi phiên, tự dọn phiên bỏ dở) ---
+# Xóa cache thì đóng kho luôn để không bỏ lại file tạm (ảnh CCCD, PDF) trên đĩa
+@st.cache_resource(on_release=SessionResourceManager.close)
+def get_session_resources():
+    return SessionResourceManager()
 
-reader = get_reader()
+tai_nguyen = get_session_resources()
+tai_nguyen.touch(st.session_state.session_id)
 
 # --- Kết nối SQLite ---
-conn = sqlite3.connect("lich_su_giao_dich.db", check_same_thread=False)
+# AMS_DB_PATH cho phép trỏ sang CSDL khác (ví dụ CSDL mẫu của load_test.py)
+DB_PATH = os.environ.get("AMS_DB_PATH", "lich_su_giao_dich.db")
+conn = sqlite3.connect(DB_PATH, check_same_thread=False)
 c = conn.cursor()
 c.execute('''
 CREATE TABLE IF NOT EXISTS lich_su (
@@ -107,119 +124,6 @@ def doc_so_thanh_chu(number):
             ket_qua += doc_ba_so(p) + " " + don_vi[len(parts) - 1 - i] + " "
     return ket_qua.strip().capitalize() + " đồng"
 
-# --- Image helpers ---
-def _bytes_to_bgr(image_bytes):
-    return cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_COLOR)
-
-def preprocess_image_for_ocr(image_bytes):
-    img = _bytes_to_bgr(image_bytes)
-    if img is None:
-        return None
-    # cải thiện: grayscale -> bilateral -> adaptive threshold
-    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-    gray = cv2.bilateralFilter(gray, 9, 75, 75)
-    thr = cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
-                                 cv2.THRESH_BINARY, 31, 9)
-    # trả về màu BGR vì easyocr chấp nhận cả ảnh màu/ngang
-    return cv2.cvtColor(thr, cv2.COLOR_GRAY2BGR)
-
-# --- EasyOCR extract helper (dùng detail=0 -> list text) ---
-def _easyocr_texts_from_bytes(image_bytes):
-    img = _bytes_to_bgr(image_bytes)
-    if img is None:
-        return []
-    try:
-        texts = reader.readtext(img, detail=0)
-        return [str(t).strip() for t in texts if t is not None]
-    except Exception:
-        # fallback: dùng preprocessed
-        proc = preprocess_image_for_ocr(image_bytes)
-        if proc is None:
-            return []
-        try:
-            texts = reader.readtext(proc, detail=0)
-            return [str(t).strip() for t in texts if t is not None]
-        except Exception:
-            return []
-
-# --- Hàm OCR CCCD bằng EasyOCR ---
-def trich_xuat_cccd_easy(image_bytes):
-    ho_ten, so_cccd, que_quan = "", "", ""
-    try:
-        texts = _easyocr_texts_from_bytes(image_bytes)
-        if not texts:
-            return "", "", ""
-        texts_upper = [t.upper() for t in texts]
-
-        # Tìm "HỌ VÀ TÊN" hoặc "HỌ TÊN" hoặc "HỌ & TÊN"
-        for i, t in enumerate(texts_upper):
-            if "HỌ VÀ TÊN" in t or "HỌ TÊN" in t or "HỌ VÀ TÊN:" in t or "HỌ & TÊN" in t:
-                if i + 1 < len(texts):
-                    ho_ten = texts[i + 1]
-                break
-        # fallback: tìm dòng chứa "Họ" + dấu ví dụ "Họ tên: NGUYEN VAN A"
-        if not ho_ten:
-            for t in texts:
-                m = re.search(r"Họ( và)? tên[:\s\-]*([A-Za-zÀ-ỹ\s]+)", t, re.IGNORECASE)
-                if m:
-                    ho_ten = m.group(2).strip()
-                    break
-
-        # Số CCCD (12 chữ số)
-        pat_cccd = re.compile(r"\d{12}")
-        for t in texts:
-            m = pat_cccd.search(t.replace(" ", ""))
-            if m:
-                so_cccd = m.group(0)
-                break
-
-        # Quê quán
-        for i, t in enumerate(texts_upper):
-            if "QUÊ QUÁN" in t or "QUE QUAN" in t:
-                if i + 1 < len(texts):
-                    que_quan = texts[i + 1]
-                break
-        # fallback: nếu vẫn rỗng, tìm dòng chứa từ "QUÊ" hoặc "QUÊ QUÁN"
-        if not que_quan:
-            for t in texts:
-                if "QUÊ" in t.upper():
-                    que_quan = t
-                    break
-
-        return ho_ten, so_cccd, que_quan
-    except Exception:
-        return "", "", ""
-
-# --- Hàm OCR cân bằng EasyOCR ---
-def trich_xuat_can_easy(image_bytes):
-    try:
-        # dùng preprocessed ảnh cân để tăng độ chính xác số
-        proc = preprocess_image_for_ocr(image_bytes)
-        texts = []
-        if proc is not None:
-            try:
-                texts = reader.readtext(proc, detail=0)
-            except Exception:
-                pass
-        if not texts:
-            texts = _easyocr_texts_from_bytes(image_bytes)
-        if not texts:
-            return ""
-        candidates = []
-        for t in texts:
-            for m in re.findall(r"[0-9]+(?:[.,][0-9]+)?", str(t)):
-                val = m.replace(",", ".")
-                try:
-                    candidates.append((m, float(val)))
-                except:
-                    pass
-        if not candidates:
-            return ""
-        candidates.sort(key=lambda x: x[1], reverse=True)
-        return candidates[0][0].replace(",", ".")
-    except Exception:
-        return ""
-
 # ========== Hàm tính tiền & PDF (giữ nguyên chức năng) ==========
 def xu_ly_giao_dich(ho_va_ten, so_cccd, que_quan, items_list):
     try:
@@ -360,13 +264,13 @@ def tao_pdf_mau_01(data, ten_don_vi=""):
 
 def add_item():
     """Hàm thêm một món hàng mới vào session_state."""
-    if len(st.session_state.items) < 3:
-        st.session_state.items.append({"ten_hang": "", "so_luong": "", "don_gia": ""})
+    if len(st.session_state["items"]) < 3:
+        st.session_state["items"].append({"ten_hang": "", "so_luong": "", "don_gia": ""})
         # st.rerun() # Không cần rerun ở đây vì nút button sẽ tự động rerun
 def remove_item():
     """Hàm xóa món hàng cuối cùng khỏi session_state."""
-    if len(st.session_state.items) > 1:
-        st.session_state.items.pop()
+    if len(st.session_state["items"]) > 1:
+        st.session_state["items"].pop()
         # st.rerun() # Không cần rerun ở đây
 
 # ========== GIAO DIỆN ==========
@@ -407,18 +311,28 @@ def main_app():
         if st.button("🔴 Clear Session State"):
             # Explicitly reset the session state by deleting keys
             keys_to_delete = ["ho_ten", "so_cccd", "que_quan", "pdf_for_download", "giao_dich_data", 
-                              "ten_don_vi_input", "phuong_thuc", "items"]
+                              "ten_don_vi_input", "phuong_thuc", "items", "anh_cccd", "anh_can"]
             for k in keys_to_delete:
                 if k in st.session_state:
                     del st.session_state[k]
+            tai_nguyen.drop_session(st.session_state.session_id)
             st.rerun()
 
     with col_logout:
         if st.button("Đăng xuất"):
             st.session_state.logged_in = False
             st.session_state.username = None
+            # Xóa cả handle, nếu không lần đăng nhập sau sẽ báo "Bản kê PDF đã hết hạn"
+            for k in ["pdf_for_download", "giao_dich_data", "anh_cccd", "anh_can"]:
+                st.session_state[k] = None
+            tai_nguyen.drop_session(st.session_state.session_id)
             st.rerun()
 
+    if st.session_state.username == "admin":
+        with st.expander("Bộ nhớ phiên (PDF, ảnh)"):
+            st.write("Toàn bộ:", tai_nguyen.usage())
+            st.write("Phiên này:", tai_nguyen.usage(st.session_state.session_id))
+
     tab1, tab2 = st.tabs(["Tạo giao dịch", "Lịch sử & Thống kê"])
     with tab1:
         create_new_transaction_page()
@@ -438,46 +352,55 @@ def create_new_transaction_page():
 
         with col_cccd:
             st.subheader("Chụp ảnh hoặc tải ảnh CCCD")
-            anh_cccd = st.camera_input("Chụp ảnh CCCD")
-            uploaded_cccd = st.file_uploader("Hoặc tải ảnh CCCD", type=["jpg", "jpeg", "png"], key="cccd_uploader")
-            if anh_cccd:
+            gen = st.session_state.cccd_uploader_gen
+            anh_cccd = st.camera_input("Chụp ảnh CCCD", key=f"cccd_camera_{gen}")
+            uploaded_cccd = st.file_uploader("Hoặc tải ảnh CCCD", type=["jpg", "jpeg", "png"], key=f"cccd_uploader_{gen}")
+            anh_moi = anh_cccd or uploaded_cccd
+            if anh_moi:
+                image_bytes = anh_moi.getvalue()
                 with st.spinner("Đang xử lý OCR CCCD..."):
-                    ho_ten, so_cccd, que_quan = trich_xuat_cccd_easy(anh_cccd.read())
-                if ho_ten: st.session_state.ho_ten = ho_ten
-                if so_cccd: st.session_state.so_cccd = so_cccd
-                if que_quan: st.session_state.que_quan = que_quan
-                st.success("Đã trích xuất thông tin CCCD!")
-                st.image(anh_cccd, use_container_width=True)
-            elif uploaded_cccd:
-                with st.spinner("Đang xử lý OCR CCCD..."):
-                    ho_ten, so_cccd, que_quan = trich_xuat_cccd_easy(uploaded_cccd.read())
+                    ho_ten, so_cccd, que_quan = trich_xuat_cccd(image_bytes, get_ocr_engine(ENGINE_THEO_TRUONG["cccd"]))
                 if ho_ten: st.session_state.ho_ten = ho_ten
                 if so_cccd: st.session_state.so_cccd = so_cccd
                 if que_quan: st.session_state.que_quan = que_quan
+                # Ô nhập có key giữ giá trị cũ và bỏ qua value=..., nên ghi thẳng vào key của ô
+                st.session_state.ho_ten_input = st.session_state.ho_ten
+                st.session_state.so_cccd_input = st.session_state.so_cccd
+                st.session_state.que_quan_input = st.session_state.que_quan
+                st.session_state.anh_cccd = tai_nguyen.put(st.session_state.session_id, "anh_cccd", image_bytes)
+                # Đổi key để Streamlit bỏ file đã tải lên (và không OCR lại mỗi lần rerun),
+                # ảnh được hiển thị lại từ kho của phiên
+                st.session_state.cccd_uploader_gen += 1
+                st.rerun()
+            if st.session_state.anh_cccd and tai_nguyen.exists(st.session_state.anh_cccd):
                 st.success("Đã trích xuất thông tin CCCD!")
-                st.image(uploaded_cccd, use_container_width=True)
+                # Chỉ đọc ảnh khi người dùng muốn xem: st.image giữ bytes trong RAM của phiên
+                if st.checkbox("Xem ảnh CCCD", key="xem_anh_cccd"):
+                    st.image(tai_nguyen.get(st.session_state.anh_cccd), use_container_width=True)
         
         # Hiện tại OCR chỉ hỗ trợ 1 món, nên chỉ hiện OCR cân cho món 1
         with col_can:
             st.subheader("Chụp ảnh hoặc tải ảnh cân")
-            anh_can = st.camera_input("Chụp ảnh màn hình cân")
-            uploaded_can = st.file_uploader("Hoặc tải ảnh cân", type=["jpg", "jpeg", "png"], key="can_uploader")
-            if anh_can:
+            gen = st.session_state.can_uploader_gen
+            anh_can = st.camera_input("Chụp ảnh màn hình cân", key=f"can_camera_{gen}")
+            uploaded_can = st.file_uploader("Hoặc tải ảnh cân", type=["jpg", "jpeg", "png"], key=f"can_uploader_{gen}")
+            anh_moi = anh_can or uploaded_can
+            if anh_moi:
+                image_bytes = anh_moi.getvalue()
                 with st.spinner("Đang xử lý OCR cân..."):
-                    so_luong_item1 = trich_xuat_can_easy(anh_can.read())
+                    so_luong_item1 = trich_xuat_can(image_bytes, get_ocr_engine(ENGINE_THEO_TRUONG["can"]))
                 if so_luong_item1:
-                    if len(st.session_state.items) > 0:
-                        st.session_state.items[0]['so_luong'] = so_luong_item1
-                st.success("Đã trích xuất khối lượng!")
-                st.image(anh_can, use_container_width=True)
-            elif uploaded_can:
-                with st.spinner("Đang xử lý OCR cân..."):
-                    so_luong_item1 = trich_xuat_can_easy(uploaded_can.read())
-                if so_luong_item1:
-                    if len(st.session_state.items) > 0:
-                        st.session_state.items[0]['so_luong'] = so_luong_item1
+                    if len(st.session_state["items"]) > 0:
+                        st.session_state["items"][0]['so_luong'] = so_luong_item1
+                        # Nếu không, ô so_luong_0 (có key) ghi đè lại giá trị cũ khi render
+                        st.session_state.so_luong_0 = so_luong_item1
+                st.session_state.anh_can = tai_nguyen.put(st.session_state.session_id, "anh_can", image_bytes)
+                st.session_state.can_uploader_gen += 1
+                st.rerun()
+            if st.session_state.anh_can and tai_nguyen.exists(st.session_state.anh_can):
                 st.success("Đã trích xuất khối lượng!")
-                st.image(uploaded_can, use_container_width=True)
+                if st.checkbox("Xem ảnh cân", key="xem_anh_can"):
+                    st.image(tai_nguyen.get(st.session_state.anh_can), use_container_width=True)
         
         st.markdown("---")
 
@@ -503,26 +426,26 @@ def create_new_transaction_page():
     # Các nút để thêm/xóa món hàng
     col_add_item, col_remove_item = st.columns([1,1])
     with col_add_item:
-        st.button("➕ Thêm món hàng", on_click=add_item, disabled=(len(st.session_state.items) >= 3))
+        st.button("➕ Thêm món hàng", on_click=add_item, disabled=(len(st.session_state["items"]) >= 3))
     with col_remove_item:
-        st.button("➖ Xóa món hàng cuối", on_click=remove_item, disabled=(len(st.session_state.items) <= 1))
+        st.button("➖ Xóa món hàng cuối", on_click=remove_item, disabled=(len(st.session_state["items"]) <= 1))
 
     # Tạo các cột nhập liệu cho từng món hàng
-    for i in range(len(st.session_state.items)):
+    for i in range(len(st.session_state["items"])):
         st.markdown(f"**Món hàng {i+1}**")
         cols = st.columns([2, 1, 1])
         with cols[0]:
-            st.session_state.items[i]['ten_hang'] = st.text_input(f"Tên hàng hóa", 
-                                                                 value=st.session_state.items[i].get('ten_hang', ''),
+            st.session_state["items"][i]['ten_hang'] = st.text_input(f"Tên hàng hóa", 
+                                                                 value=st.session_state["items"][i].get('ten_hang', ''),
                                                                  key=f"ten_hang_{i}")
         with cols[1]:
-            st.session_state.items[i]['so_luong'] = st.text_input(f"Khối lượng (chỉ)", 
-                                                                 value=st.session_state.items[i].get('so_luong', ''),
+            st.session_state["items"][i]['so_luong'] = st.text_input(f"Khối lượng (chỉ)", 
+                                                                 value=st.session_state["items"][i].get('so_luong', ''),
                                                                  disabled=(i == 0 and st.session_state.phuong_thuc == "Sử dụng OCR"),
                                                                  key=f"so_luong_{i}")
         with cols[2]:
-            st.session_state.items[i]['don_gia'] = st.text_input(f"Đơn giá (VNĐ/chỉ)", 
-                                                                 value=st.session_state.items[i].get('don_gia', ''),
+            st.session_state["items"][i]['don_gia'] = st.text_input(f"Đơn giá (VNĐ/chỉ)", 
+                                                                 value=st.session_state["items"][i].get('don_gia', ''),
                                                                  key=f"don_gia_{i}")
     
     st.markdown("---")
@@ -535,7 +458,7 @@ def create_new_transaction_page():
         ten_don_vi_val = st.session_state.ten_don_vi_input
 
         # Lấy danh sách items đã nhập
-        items_list = st.session_state.items
+        items_list = st.session_state["items"]
         
         # Kiểm tra dữ liệu bắt buộc
         valid_items = [item for item in items_list if item['ten_hang'] and item['so_luong'] and item['don_gia']]
@@ -549,26 +472,48 @@ def create_new_transaction_page():
                 st.write(f"Bằng chữ: {doc_so_thanh_chu(giao_dich_data['tong_thanh_tien'])}")
 
                 pdf_buffer = tao_pdf_mau_01(giao_dich_data, ten_don_vi_val)
-                st.session_state.pdf_for_download = pdf_buffer
-                st.session_state.giao_dich_data = giao_dich_data
+                sid = st.session_state.session_id
+                st.session_state.pdf_for_download = tai_nguyen.put(sid, "pdf", pdf_buffer.getvalue())
+                st.session_state.giao_dich_data = tai_nguyen.put(
+                    sid, "giao_dich", json.dumps(giao_dich_data, ensure_ascii=False).encode("utf-8"))
 
     # Hiển thị download PDF nếu có
     if st.session_state.pdf_for_download:
-        st.download_button(
-            "Tải bản kê PDF (Mẫu 01/TNDN)",
-            data=st.session_state.pdf_for_download.getvalue(),
-            file_name=f"bang_ke_{(st.session_state.giao_dich_data['ho_va_ten']).replace(' ', '_')}.pdf",
-            mime="application/pdf"
-        )
+        pdf_handle = st.session_state.pdf_for_download
+        giao_dich_json = tai_nguyen.get(st.session_state.giao_dich_data) if st.session_state.giao_dich_data else None
+        if tai_nguyen.exists(pdf_handle) and giao_dich_json:
+            giao_dich_data = json.loads(giao_dich_json)
+
+            # data là hàm: PDF chỉ được đọc từ kho khi bấm tải, không nằm sẵn trong RAM mỗi lần rerun
+            def doc_pdf():
+                pdf = tai_nguyen.get(pdf_handle)
+                if pdf is None:
+                    # Bản kê bị dọn giữa lúc hiển thị và lúc bấm: báo lỗi tải xuống thay vì
+                    # trả file rỗng; lần rerun sau sẽ hiện thông báo hết hạn bên dưới
+                    raise FileNotFoundError("Bản kê PDF đã hết hạn, vui lòng lưu lại giao dịch để tạo bản mới.")
+                return pdf
+
+            st.download_button(
+                "Tải bản kê PDF (Mẫu 01/TNDN)",
+                data=doc_pdf,
+                file_name=f"bang_ke_{(giao_dich_data['ho_va_ten']).replace(' ', '_')}.pdf",
+                mime="application/pdf"
+            )
+        else:
+            # Phiên bỏ dở quá lâu, bản kê đã bị dọn khỏi kho
+            st.session_state.pdf_for_download = None
+            st.session_state.giao_dich_data = None
+            st.info("Bản kê PDF đã hết hạn, vui lòng lưu lại giao dịch để tạo bản mới.")
     
     st.markdown("---")
     if st.button("Làm mới trang", key="refresh_button"):
         # reset keys (giữ login)
         keys_to_delete = ["ho_ten", "so_cccd", "que_quan", "pdf_for_download", "giao_dich_data", 
-                              "ten_don_vi_input", "phuong_thuc", "items"]
+                              "ten_don_vi_input", "phuong_thuc", "items", "anh_cccd", "anh_can"]
         for k in keys_to_delete:
             if k in st.session_state:
                 del st.session_state[k]
+        tai_nguyen.drop_session(st.session_state.session_id)
         st.rerun()
 
 def history_and_stats_page():